@@ -65,17 +65,19 @@ Possible improvements:
 import sys
 import os
 import io
-import pathlib
 import re
 import argparse
 import zipfile
 import json
 import pickle
 import pprint
-import urllib.parse
+import base64
 
 from typing import (
+    Any,
     Dict,
+    List,
+    Tuple,
 )
 
 import torch.utils.show_pickle
@@ -83,6 +85,57 @@ import torch.utils.show_pickle
 
 DEFAULT_EXTRA_FILE_SIZE_LIMIT = 16 * 1024
 
+class _WriteLimitReached(Exception):
+    pass
+
+
+class _LimitedStringWriter:
+    """Write sink that gives up once too much output has accumulated.
+
+    pprint renders of pickles with shared structure can explode to many
+    times the file size, so abandon oversized renders as soon as they
+    cross the limit instead of formatting the whole thing and then
+    throwing it away.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.size = 0
+        self.limit = sys.maxsize
+
+    def reset(self, limit):
+        self.parts.clear()
+        self.size = 0
+        self.limit = limit
+
+    def write(self, s):
+        self.size += len(s)
+        if self.size > self.limit:
+            raise _WriteLimitReached
+        self.parts.append(s)
+        return len(s)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+try:
+    _str_is_ascii = str.isascii  # type: ignore[attr-defined]
+except AttributeError:
+    # Python 3.6.  Non-ASCII characters take at least two bytes in
+    # UTF-8, so a string is all-ASCII iff its encoding is no longer.
+    def _str_is_ascii(s):
+        return len(s) == len(s.encode("utf-8"))
+
+
+# Matches torch.jit._pickle.build_intlist and friends.
+_BUILD_LIST_RE = re.compile(r"torch\.jit\._pickle\.build_[a-z]+list")
+
+# Types that hierarchical_pickle passes through unchanged.
+# Checked by exact type first because scalars (mostly strings and ints)
+# dominate real model data and the isinstance cascade is comparatively slow.
+_SIMPLE_TYPES = {bool, int, float, str, type(None)}
+
 
 def get_storage_info(storage):
     assert isinstance(storage, torch.utils.show_pickle.FakeObject)
@@ -103,78 +156,117 @@ def get_storage_info(storage):
 
 
 def hierarchical_pickle(data):
-    if isinstance(data, (bool, int, float, str, type(None))):
-        return data
-    if isinstance(data, list):
-        return [hierarchical_pickle(d) for d in data]
-    if isinstance(data, tuple):
-        return {
-            "__tuple_values__": hierarchical_pickle(list(data)),
-        }
-    if isinstance(data, dict):
-        return {
-            "__is_dict__": True,
-            "keys": hierarchical_pickle(list(data.keys())),
-            "values": hierarchical_pickle(list(data.values())),
-        }
-    if isinstance(data, torch.utils.show_pickle.FakeObject):
-        typename = f"{data.module}.{data.name}"
-        if typename.startswith("__torch__."):
-            assert data.args == ()
-            return {
-                "__module_type__": typename,
-                "state": hierarchical_pickle(data.state),
+    # Model data can nest arbitrarily deep (e.g. container modules),
+    # so walk it with an explicit stack instead of recursing.
+    # Each stack entry is (value, destination, key): the converted value
+    # is stored at destination[key], and child values are pushed with
+    # their own slot in the partially-built output.
+    result: List[Any] = [None]
+    stack: List[Tuple[Any, Any, Any]] = [(data, result, 0)]
+    while stack:
+        data, dest, key = stack.pop()
+        if type(data) in _SIMPLE_TYPES:
+            dest[key] = data
+            continue
+        # Slow path for scalar subclasses (the fast path above is an
+        # exact type match).
+        if isinstance(data, (bool, int, float, str, type(None))):
+            dest[key] = data
+            continue
+        if isinstance(data, list):
+            out: List[Any] = [None] * len(data)
+            dest[key] = out
+            for idx, d in enumerate(data):
+                stack.append((d, out, idx))
+            continue
+        if isinstance(data, tuple):
+            out = [None] * len(data)
+            dest[key] = {
+                "__tuple_values__": out,
             }
-        if typename == "torch._utils._rebuild_tensor_v2":
-            assert data.state is None
-            storage, offset, size, stride, requires_grad, hooks = data.args
-            storage_info = get_storage_info(storage)
-            return {"__tensor_v2__": [storage_info, offset, size, stride, requires_grad]}
-        if typename == "torch._utils._rebuild_qtensor":
-            assert data.state is None
-            storage, offset, size, stride, quantizer, requires_grad, hooks = data.args
-            storage_info = get_storage_info(storage)
-            assert isinstance(quantizer, tuple)
-            assert isinstance(quantizer[0], torch.utils.show_pickle.FakeClass)
-            assert quantizer[0].module == "torch"
-            if quantizer[0].name == "per_tensor_affine":
-                assert len(quantizer) == 3
-                assert isinstance(quantizer[1], float)
-                assert isinstance(quantizer[2], int)
-                quantizer_extra = list(quantizer[1:3])
-            else:
-                quantizer_extra = []
-            quantizer_json = [quantizer[0].name] + quantizer_extra
-            return {"__qtensor__": [storage_info, offset, size, stride, quantizer_json, requires_grad]}
-        if typename == "torch.jit._pickle.restore_type_tag":
-            assert data.state is None
-            obj, typ = data.args
-            assert isinstance(typ, str)
-            return hierarchical_pickle(obj)
-        if re.fullmatch(r"torch\.jit\._pickle\.build_[a-z]+list", typename):
-            assert data.state is None
-            ls, = data.args
-            assert isinstance(ls, list)
-            return hierarchical_pickle(ls)
-        if typename == "torch.device":
-            assert data.state is None
-            name, = data.args
-            assert isinstance(name, str)
-            # Just forget that it was a device and return the name.
-            return name
-        if typename == "builtin.UnicodeDecodeError":
-            assert data.state is None
-            msg, = data.args
-            assert isinstance(msg, str)
-            # Hack: Pretend this is a module so we don't need custom serialization.
-            # Hack: Wrap the message in a tuple so it looks like a nice state object.
-            # TODO: Undo at least that second hack.  We should support string states.
-            return {
-                "__module_type__": typename,
-                "state": hierarchical_pickle((msg,)),
+            for idx, d in enumerate(data):
+                stack.append((d, out, idx))
+            continue
+        if isinstance(data, dict):
+            keys_out: List[Any] = [None] * len(data)
+            values_out: List[Any] = [None] * len(data)
+            dest[key] = {
+                "__is_dict__": True,
+                "keys": keys_out,
+                "values": values_out,
             }
-        raise Exception(f"Can't prepare fake object of type for JS: {typename}")
-    raise Exception(f"Can't prepare data of type for JS: {type(data)}")
+            for idx, (k, v) in enumerate(data.items()):
+                stack.append((k, keys_out, idx))
+                stack.append((v, values_out, idx))
+            continue
+        if isinstance(data, torch.utils.show_pickle.FakeObject):
+            typename = f"{data.module}.{data.name}"
+            if typename.startswith("__torch__."):
+                assert data.args == ()
+                container : Dict[str, Any] = {
+                    "__module_type__": typename,
+                    "state": None,
+                }
+                dest[key] = container
+                stack.append((data.state, container, "state"))
+                continue
+            if typename == "torch._utils._rebuild_tensor_v2":
+                assert data.state is None
+                storage, offset, size, stride, requires_grad, hooks = data.args
+                storage_info = get_storage_info(storage)
+                dest[key] = {"__tensor_v2__": [storage_info, offset, size, stride, requires_grad]}
+                continue
+            if typename == "torch._utils._rebuild_qtensor":
+                assert data.state is None
+                storage, offset, size, stride, quantizer, requires_grad, hooks = data.args
+                storage_info = get_storage_info(storage)
+                assert isinstance(quantizer, tuple)
+                assert isinstance(quantizer[0], torch.utils.show_pickle.FakeClass)
+                assert quantizer[0].module == "torch"
+                if quantizer[0].name == "per_tensor_affine":
+                    assert len(quantizer) == 3
+                    assert isinstance(quantizer[1], float)
+                    assert isinstance(quantizer[2], int)
+                    quantizer_extra = list(quantizer[1:3])
+                else:
+                    quantizer_extra = []
+                quantizer_json = [quantizer[0].name] + quantizer_extra
+                dest[key] = {"__qtensor__": [storage_info, offset, size, stride, quantizer_json, requires_grad]}
+                continue
+            if typename == "torch.jit._pickle.restore_type_tag":
+                assert data.state is None
+                obj, typ = data.args
+                assert isinstance(typ, str)
+                stack.append((obj, dest, key))
+                continue
+            if _BUILD_LIST_RE.fullmatch(typename):
+                assert data.state is None
+                ls, = data.args
+                assert isinstance(ls, list)
+                stack.append((ls, dest, key))
+                continue
+            if typename == "torch.device":
+                assert data.state is None
+                name, = data.args
+                assert isinstance(name, str)
+                # Just forget that it was a device and return the name.
+                dest[key] = name
+                continue
+            if typename == "builtin.UnicodeDecodeError":
+                assert data.state is None
+                msg, = data.args
+                assert isinstance(msg, str)
+                # Hack: Pretend this is a module so we don't need custom serialization.
+                # Hack: Wrap the message in a tuple so it looks like a nice state object.
+                # TODO: Undo at least that second hack.  We should support string states.
+                dest[key] = {
+                    "__module_type__": typename,
+                    "state": {"__tuple_values__": [msg]},
+                }
+                continue
+            raise Exception(f"Can't prepare fake object of type for JS: {typename}")
+        raise Exception(f"Can't prepare data of type for JS: {type(data)}")
+    return result[0]
 
 
 def get_model_info(
@@ -187,12 +279,9 @@ def get_model_info(
     or passed to burn_in_info.
     """
 
-    if isinstance(path_or_file, os.PathLike):
+    if isinstance(path_or_file, (str, os.PathLike)):
         default_title = os.fspath(path_or_file)
-        file_size = path_or_file.stat().st_size  # type: ignore[attr-defined]
-    elif isinstance(path_or_file, str):
-        default_title = path_or_file
-        file_size = pathlib.Path(path_or_file).stat().st_size
+        file_size = os.stat(path_or_file).st_size
     else:
         default_title = "buffer"
         path_or_file.seek(0, io.SEEK_END)
@@ -203,26 +292,48 @@ def get_model_info(
 
     with zipfile.ZipFile(path_or_file) as zf:
         path_prefix = None
-        zip_files = []
-        for zi in zf.infolist():
-            prefix = re.sub("/.*", "", zi.filename)
+        zip_files : List[Dict[str, Any]] = []
+        # One pass over the zip directory: build the file listing and
+        # bucket the members the later stages care about, rather than
+        # re-walking infolist() for each stage.
+        code_members = []
+        json_members = []
+        pickle_members = []
+        append_zip_file = zip_files.append
+        # zf.filelist is the very list infolist() returns; consuming it
+        # directly skips the method call, and fetching each filename once
+        # avoids re-doing the attribute lookup for every check below.
+        for zi in zf.filelist:
+            filename = zi.filename
+            prefix = filename.partition("/")[0]
             if path_prefix is None:
                 path_prefix = prefix
             elif prefix != path_prefix:
                 raise Exception(f"Mismatched prefixes: {path_prefix} != {prefix}")
-            zip_files.append(dict(
-                filename=zi.filename,
-                compression=zi.compress_type,
-                compressed_size=zi.compress_size,
-                file_size=zi.file_size,
-            ))
+            append_zip_file({
+                "filename": filename,
+                "compression": zi.compress_type,
+                "compressed_size": zi.compress_size,
+                "file_size": zi.file_size,
+            })
+            if filename.endswith(".py"):
+                code_members.append(zi)
+            elif filename.endswith(".json"):
+                json_members.append(zi)
+            elif filename.endswith(".pkl"):
+                pickle_members.append(zi)
 
         assert path_prefix is not None
         version = zf.read(path_prefix + "/version").decode("utf-8").strip()
 
-        with zf.open(path_prefix + "/data.pkl") as handle:
-            raw_model_data = torch.utils.show_pickle.DumpUnpickler(handle, catch_invalid_utf8=True).load()
-            model_data = hierarchical_pickle(raw_model_data)
+        data_pkl_name = path_prefix + "/data.pkl"
+        # Decompress the whole member up front; the unpickler's many small
+        # reads then hit an in-memory buffer, and the raw bytes can be
+        # reused by the extra-pickle stage below.
+        raw_data_pkl = zf.read(data_pkl_name)
+        raw_model_data = torch.utils.show_pickle.DumpUnpickler(
+            io.BytesIO(raw_data_pkl), catch_invalid_utf8=True).load()
+        model_data = hierarchical_pickle(raw_model_data)
 
         # Intern strings that are likely to be re-used.
         # Pickle automatically detects shared structure,
@@ -232,21 +343,19 @@ def get_model_info(
         interned_strings : Dict[str, int] = {}
 
         def ist(s):
-            if s not in interned_strings:
-                interned_strings[s] = len(interned_strings)
-            return interned_strings[s]
+            # setdefault hashes the string once, vs. up to three
+            # lookups for the test-assign-return pattern.
+            return interned_strings.setdefault(s, len(interned_strings))
 
         code_files = {}
-        for zi in zf.infolist():
-            if not zi.filename.endswith(".py"):
-                continue
-            with zf.open(zi) as handle:
-                raw_code = handle.read()
-            with zf.open(zi.filename + ".debug_pkl") as handle:
-                raw_debug = handle.read()
+        for zi in code_members:
+            raw_code = zf.read(zi)
+            raw_debug = zf.read(zi.filename + ".debug_pkl")
 
             # Parse debug info and add begin/end markers if not present
             # to ensure that we cover the entire source code.
+            # Debug pickles contain only primitive types, so the fast
+            # C unpickler is safe here (no classes get imported).
             debug_info_t = pickle.loads(raw_debug)
             assert isinstance(debug_info_t, tuple)
             debug_info = list(debug_info_t)
@@ -255,7 +364,13 @@ def get_model_info(
             if debug_info[-1][0] != len(raw_code):
                 debug_info.append((len(raw_code), (('', '', 0), 0, 0)))
 
-            code_parts = []
+            # Decode the source once.  For all-ASCII files (the common case)
+            # byte offsets equal character offsets, so the decoded string can
+            # be sliced directly instead of decoding every slice separately.
+            code_text = raw_code.decode("utf-8")
+            code_is_ascii = len(code_text) == len(raw_code)
+            code_parts : List[List[Any]] = []
+            append_part = code_parts.append
             for di, di_next in zip(debug_info, debug_info[1:]):
                 start, source_range, *_ = di
                 end = di_next[0]
@@ -266,16 +381,19 @@ def get_model_info(
                 # but JS doesn't really handle byte strings.
                 # if bytes and chars are not equivalent for this string,
                 # zero out the ranges so we don't highlight the wrong thing.
-                if len(s_text) != len(s_text.encode("utf-8")):
+                if not _str_is_ascii(s_text):
                     s_start = 0
                     s_end = 0
-                text = raw_code[start:end]
-                code_parts.append([text.decode("utf-8"), ist(s_file), s_line, ist(s_text), s_start, s_end])
+                if code_is_ascii:
+                    text = code_text[start:end]
+                else:
+                    text = raw_code[start:end].decode("utf-8")
+                append_part([text, ist(s_file), s_line, ist(s_text), s_start, s_end])
             code_files[zi.filename] = code_parts
 
         extra_files_json_pattern = re.compile(re.escape(path_prefix) + "/extra/.*\\.json")
         extra_files_jsons = {}
-        for zi in zf.infolist():
+        for zi in json_members:
             if not extra_files_json_pattern.fullmatch(zi.filename):
                 continue
             if zi.file_size > extra_file_size_limit:
@@ -291,23 +409,32 @@ def get_model_info(
             "bytecode.pkl",
         }
         extra_pickles = {}
-        for zi in zf.infolist():
-            if not zi.filename.endswith(".pkl"):
-                continue
-            with zf.open(zi) as handle:
-                # TODO: handle errors here and just ignore the file?
-                # NOTE: For a lot of these files (like bytecode),
-                # we could get away with just unpickling, but this should be safer.
-                obj = torch.utils.show_pickle.DumpUnpickler(handle, catch_invalid_utf8=True).load()
-            buf = io.StringIO()
-            pprint.pprint(obj, buf)
-            contents = buf.getvalue()
-            # Checked the rendered length instead of the file size
+        # One reusable sink for the pretty-printed pickles rather than a
+        # fresh buffer per member.
+        render_buf = _LimitedStringWriter()
+        for zi in pickle_members:
+            # data.pkl was already decompressed for the model data above,
+            # so reuse those bytes instead of decompressing a second time.
+            if zi.filename == data_pkl_name:
+                raw_pickle = raw_data_pkl
+            else:
+                raw_pickle = zf.read(zi)
+            # TODO: handle errors here and just ignore the file?
+            # NOTE: For a lot of these files (like bytecode),
+            # we could get away with just unpickling, but this should be safer.
+            obj = torch.utils.show_pickle.DumpUnpickler(
+                io.BytesIO(raw_pickle), catch_invalid_utf8=True).load()
+            # Limit the rendered length instead of the file size
             # because pickles with shared structure can explode in size during rendering.
-            if os.path.basename(zi.filename) not in always_render_pickles and \
-                    len(contents) > extra_file_size_limit:
+            if os.path.basename(zi.filename) in always_render_pickles:
+                render_buf.reset(sys.maxsize)
+            else:
+                render_buf.reset(extra_file_size_limit)
+            try:
+                pprint.pprint(obj, render_buf)  # type: ignore[arg-type]
+            except _WriteLimitReached:
                 continue
-            extra_pickles[zi.filename] = contents
+            extra_pickles[zi.filename] = render_buf.getvalue()
 
     return {"model": dict(
         title=title,
@@ -322,13 +449,23 @@ def get_model_info(
     )}
 
 
+_inline_skeleton_cache = None
+
+
 def get_inline_skeleton():
     """Get a fully-inlined skeleton of the frontend.
 
     The returned HTML page has no external network dependencies for code.
     It can load model_info.json over HTTP, or be passed to burn_in_info.
+
+    The composed page is cached after the first call, since the
+    packaged resources can't change within a process.
     """
 
+    global _inline_skeleton_cache
+    if _inline_skeleton_cache is not None:
+        return _inline_skeleton_cache
+
     if sys.version_info < (3, 7):
         raise Exception("get_inline_skeleton requires Python 3.7")
 
@@ -338,9 +475,13 @@ def get_inline_skeleton():
     js_code = importlib.resources.read_text(__package__, "code.js")  # type: ignore[attr-defined]
     for js_module in ["preact", "htm"]:
         js_lib = importlib.resources.read_binary(__package__, f"{js_module}.mjs")  # type: ignore[attr-defined]
-        js_url = "data:application/javascript," + urllib.parse.quote(js_lib)
+        # base64 beats percent-encoding here: it grows the payload by a
+        # predictable 4/3 rather than 3x for every non-URL-safe byte,
+        # and encodes in one pass.
+        js_url = "data:application/javascript;base64," + base64.b64encode(js_lib).decode("ascii")
         js_code = js_code.replace(f"https://unpkg.com/{js_module}?module", js_url)
     skeleton = skeleton.replace(' src="./code.js">', ">\n" + js_code)
+    _inline_skeleton_cache = skeleton
     return skeleton
 
 
@@ -355,9 +496,11 @@ def burn_in_info(skeleton, info):
     # Since we're inlining this JSON directly into a script tag, a string
     # containing "</script>" would end the script prematurely and
     # mess up our page.  Unconditionally escape fixes that.
+    # Compact separators keep the one-shot C encoder and drop the
+    # whitespace that the default separators sprinkle everywhere.
     return skeleton.replace(
         "BURNED_IN_MODEL_INFO = null",
-        "BURNED_IN_MODEL_INFO = " + json.dumps(info).replace("/", "\\/"))
+        "BURNED_IN_MODEL_INFO = " + json.dumps(info, separators=(",", ":")).replace("/", "\\/"))
 
 
 def main(argv, stdout=None):
@@ -372,7 +515,10 @@ def main(argv, stdout=None):
     output = stdout or sys.stdout
 
     if args.style == "json":
-        output.write(json.dumps(info) + "\n")
+        # Stream the encoder's chunks to the output rather than
+        # materializing the (potentially multi-megabyte) string first.
+        json.dump(info, output, separators=(",", ":"))
+        output.write("\n")
     elif args.style == "html":
         skeleton = get_inline_skeleton()
         page = burn_in_info(skeleton, info)